@@ -129,6 +129,7 @@ class Assembler:
         self.segname: str = 'text'
         self.errcount = 0
         self.bss_seg: list[bytes | Reference] = []
+        self.seglens = {'text': 0, 'data': 0, 'bss': 0}
         self.symtab: dict[str, Symbol] = {}
         for name, val in STARTSYM.items():
             symbol = Symbol(self.segnum, name, val, label=False)
@@ -153,7 +154,7 @@ class Assembler:
     @property
     def curpc(self) -> int:
         """The current program counter position in the current segment."""
-        return Module.seglen(self.curseg)
+        return self.seglens[self.segname]
 
     def addsym(self, symbol: Symbol) -> None:
         """Add the symbol to the symbol table.
@@ -276,6 +277,7 @@ class Assembler:
         for elem in elems:
             assert isinstance(elem, (bytes | Reference))
             seg.append(elem)
+            self.seglens[self.segname] += len(elem)
 
     def pseudo(self, cmd: str, args: list[Reference]) -> None:
         """Handle a pseudo op."""
@@ -434,7 +436,7 @@ class Assembler:
         for sym in self.symtab.values():
             if sym.label:
                 self.module.symtab[sym.name] = sym.linksym()
-        self.module.bss_len = Module.seglen(self.bss_seg)
+        self.module.bss_len = self.seglens['bss']
         return self.module
 
 
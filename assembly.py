@@ -6,6 +6,14 @@ from parse_state import Parser
 import opinfo
 from symtab import Symbol
 
+# Decimal text of every byte value, for byte lists in .dc commands
+bytestrs = [str(i) for i in range(256)]
+
+
+def dcbytes(value: bytes) -> str:
+    """Return the bytes as the comma separated list for a .dc command."""
+    return ','.join(map(bytestrs.__getitem__, value))
+
 
 def asm(parser: Parser, line: str) -> None:
     """Place an assembly line into the parser's output.
@@ -14,13 +22,20 @@ def asm(parser: Parser, line: str) -> None:
         line = line + '\n'
     if not line[0] in whitespace:
         line = '\t' + line
-    parser.asm += line
+    parser.asmbuf.append(line)
+
+
+def asmop(parser: Parser, op: str, arg: object) -> None:
+    """Place an assembly line of an op and its one argument into the
+    parser's output, without asm's checks on an already built line.
+    """
+    parser.asmbuf.append(f'\t{op} {arg}\n')
 
 
 def deflab(parser, name: str) -> None:
     """Define an assembly label here.
     """
-    parser.asm += f'{name}:'
+    parser.asmbuf.append(f'{name}:')
 
 
 def pseudo(parser, line: str) -> None:
@@ -87,7 +102,7 @@ def asmval(parser: Parser, leaf: Leaf) -> str:
             oldseg = goseg(parser, 'string')
             lab = parser.nextstatic()
             deflab(parser, lab)
-            asm(parser, f".dc {','.join((str(b) for b in value))}")
+            asmop(parser, '.dc', dcbytes(value))
             goseg(parser, oldseg)
             return f'extern {lab}'
         case _:
@@ -135,7 +150,7 @@ def asmnode(parser: Parser, node: Node) -> None:
                 isinstance(node.children[1].value, int)
             offset = node.children[1].value
             if offset:
-                asm(parser, f'con {offset}')
+                asmop(parser, 'con', offset)
                 asm(parser, 'add')
         case 'deref':
             # do nothing
@@ -150,7 +165,7 @@ def asmnode(parser: Parser, node: Node) -> None:
                 rval(parser, child)
                 asm(parser, 'arg')
             asmnode(parser, node.children[0])
-            asm(parser, f'call {len(node.children[1:])}')
+            asmop(parser, 'call', len(node.children[1:]))
         case _:
             asmchildren(parser, node)
             if isinstance(node, Leaf):
@@ -17,8 +17,18 @@ DEBUG = False
 
 
 def compile_c6t(source: str) -> tuple[str, int]:
-    """Preprocess and compile the given source text. Returns the compiled text
+    r"""Preprocess and compile the given source text. Returns the compiled text
     and an error count.
+
+    A name used in a global initializer before being declared is entered as an
+    undefined local, so it is reported when the next function ends:
+
+    >>> _, errors = compile_c6t('int sz sizeof y;\nf() { return (1); }\n'
+    ...                         'int y 5;\nmain() { return (y); }\n')
+    2: undefined symbol y
+    Total errors: 1
+    >>> errors
+    1
     """
     source = preproc.preproc(source)
     tokenizer = Tokenizer(source)
@@ -641,6 +641,23 @@ class Code80(CodeGen):
                     value=len(args))
         self.eval(node)
 
+    def dswitch(self, expr: BackNode, deflab: BackNode, span: BackNode,
+                low: BackNode, tablab: BackNode) -> None:
+        """Assemble a switch statement over a table indexed by value."""
+        args = [
+            Node('extern', value=deflab.value),
+            Node('con', value=span.value),
+            Node('con', value=low.value),
+            Node('extern', value=tablab.value),
+            self.convert(expr),
+        ]
+        args = [Node('arg', node) for node in reversed(args)]
+        node = Node('call',
+                    Node('extern', value='dswitch'),
+                    Node.join('comma', *args),
+                    value=len(args))
+        self.eval(node)
+
     def command(self, command: Command, nodestk: list[BackNode]) -> None:
         match command.cmd:
             case 'ijmp':
@@ -651,6 +668,13 @@ class Code80(CodeGen):
                 brklab = nodestk.pop()
                 expr = nodestk.pop()
                 self.doswitch(expr, brklab, cases, tablab)
+            case 'dswitch':
+                tablab = nodestk.pop()
+                low = nodestk.pop()
+                span = nodestk.pop()
+                deflab = nodestk.pop()
+                expr = nodestk.pop()
+                self.dswitch(expr, deflab, span, low, tablab)
             case '.text' | '.data' | '.string' | '.bss':
                 self.state.curseg = command.cmd
             case '.export':
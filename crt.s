@@ -268,6 +268,56 @@ swbad:
     sta i+1
     jmp swloop
 
+dswitch:
+    .export dswitch
+    ; on stack, from bottom to top:
+    ; - expression value
+    ; - table addr
+    ; - lowest case value
+    ; - number of table entries
+    ; - default addr
+    ; - return address (but we never return)
+
+    ; table format:
+    ; - one word per value from the lowest case up, the addr to go to
+
+    ; Need to preserve BC, DE and HL don't matter
+    pop h ; destroy return address
+
+    pop h ; default to N
+    shld n
+    pop h ; number of entries to I
+    shld i
+    pop d ; lowest case value to DE
+    pop h ; table addr to HL
+    xthl ; expr value to HL, table addr back on the stack
+    mov a,l ; HL = index from the lowest case
+    sub e
+    mov l,a
+    mov a,h
+    sbb d
+    mov h,a
+    xchg ; index to DE
+    lhld i
+    mov a,e ; carry if index < number of entries, as unsigned
+    sub l
+    mov a,d
+    sbb h
+    pop h ; table addr to HL
+    jnc dswdef
+    xchg ; index to HL, table to DE
+    dad h
+    dad d ; HL = table addr + index * 2
+    mov a,m
+    inx h
+    mov h,m
+    mov l,a
+    pchl ; Jump!
+dswdef:
+    ; out of range, go to default
+    lhld n
+    pchl
+
 crshift:
     .export crshift
     ; Shift HL right DE bits, sign extended
@@ -2,17 +2,18 @@
 
 from __future__ import annotations
 import collections.abc
-from dataclasses import dataclass, field
+from dataclasses import dataclass, field, replace
 from typing import Any, Callable
 from parse_state import Parser
 from symtab import Symbol
-from type6 import Char6, Double6, Func6, Int6, Point6, TypeElem, TypeString, tysize
+from type6 import (Char6, DoubleType6, Func6, Int6, IntType6, LabelType6,
+                   Point6, TypeString, tysize, typeelem)
 from util import word
 from lexer import Token
 import opinfo
 
 
-@dataclass
+@dataclass(slots=True)
 class Node(collections.abc.MutableSequence):
     """An expression node."""
     label: str
@@ -23,7 +24,7 @@ class Node(collections.abc.MutableSequence):
     def __post_init__(self):
         assert isinstance(self.label, str)
         assert isinstance(self.linenum, int)
-        assert isinstance(self.typestr, list)
+        assert isinstance(self.typestr, tuple)
         assert isinstance(self.children, list)
         assert all((isinstance(i, Node) for i in self.children))
 
@@ -49,12 +50,51 @@ class Node(collections.abc.MutableSequence):
         return False
 
 
-@dataclass
+@dataclass(slots=True)
 class Leaf(Node):
     """A leaf expression node."""
     value: Any
 
 
+class SharedLeaf(Leaf):
+    """A leaf that may appear in many trees at once, so it is never changed
+    once built. Use dataclasses.replace to get a changed copy.
+    """
+    __slots__ = ()
+
+    # pylint:disable=super-init-not-called
+    def __init__(self, label: str, linenum: int, typestr: TypeString,
+                 children: list[Node], value: Any) -> None:
+        # The fields are stored past __setattr__, which always refuses
+        setattr_ = object.__setattr__
+        setattr_(self, 'label', label)
+        setattr_(self, 'linenum', linenum)
+        setattr_(self, 'typestr', typestr)
+        setattr_(self, 'children', children)
+        setattr_(self, 'value', value)
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        raise AttributeError(f'cannot set {name} of a shared leaf')
+
+
+# Shared leaves for the small constants that dominate real code, keyed by
+# value. Each holds the line it was last made for, so a constant is shared
+# within a line and its line number is still right for diagnostics.
+smallcons = {}  # type:dict[int, SharedLeaf]
+
+
+def conleaf(linenum: int, value: int) -> Leaf:
+    """Return an integer constant leaf, shared for small values."""
+    leaf = smallcons.get(value)
+    if leaf is not None and leaf.linenum == linenum:
+        return leaf
+    if value < 128 or value >= word(-128):
+        leaf = smallcons[value] = SharedLeaf('con', linenum, IntType6, [],
+                                             value)
+        return leaf
+    return Leaf('con', linenum, IntType6, [], value)
+
+
 def expression(parser: Parser, seecommas: bool = True) -> Node:
     """Parse an expression."""
     if seecommas:
@@ -78,14 +118,11 @@ def conexpr(parser: Parser, seecommas: bool = True, default: int = 1) -> int:
     return node.value
 
 
-def confold(node: Node) -> Node:
-    """If the node can be constant folded, return the folded version. Else,
-    return the node unmodified.
+def foldcon(label: str, children: list[int]) -> int | None:
+    """Return the result of the operation on the constant operands, or None if
+    the operation cannot be folded.
     """
-    if any(map(lambda n: n.label != 'con', node.children)):
-        return node
-    children = [word(child.value) for child in node.children]
-    match node.label:
+    match label:
         case 'add':
             result = word(sum(children))
         case 'sub':
@@ -111,8 +148,21 @@ def confold(node: Node) -> Node:
         case 'compl':
             result = word(~children[0])
         case _:
-            return node
-    return Leaf('con', node.linenum, [Int6], [], result)
+            return None
+    return result
+
+
+def confold(node: Node) -> Node:
+    """If the node can be constant folded, return the folded version. Else,
+    return the node unmodified.
+    """
+    if any(map(lambda n: n.label != 'con', node.children)):
+        return node
+    result = foldcon(node.label,
+                     [word(child.value) for child in node.children])
+    if result is None:
+        return node
+    return conleaf(node.linenum, result)
 
 
 def floating(*nodes: Node) -> bool:
@@ -125,6 +175,19 @@ def pointer(*nodes: Node) -> bool:
     return any(map(lambda n: n.typestr[0].pointer, nodes))
 
 
+def sideeffects(node: Node) -> bool:
+    """Return a flag for if evaluating the node could change anything, as
+    an assignment, increment or call does.
+    """
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        if opinfo.sideeffect[node.label]:
+            return True
+        stack.extend(node.children)
+    return False
+
+
 def doarray(parser: Parser, node: Node) -> Node:
     """Convert an array type node to &->node of type pointer.
     """
@@ -147,19 +210,19 @@ def stdconv(children: list[Node]) -> TypeString:
     """
     match len(children):
         case 1:
-            typestr = children[0].typestr.copy()
+            typestr = children[0].typestr
         case 0:
-            typestr = [Int6]
+            typestr = IntType6
         case _:
             if floating(*children):
-                typestr = [Double6]
+                typestr = DoubleType6
             elif pointer(*children):
                 for child in children:
                     if pointer(child):
-                        typestr = child.typestr.copy()
+                        typestr = child.typestr
                         break
             else:
-                typestr = [Int6]
+                typestr = IntType6
     return typestr
 
 
@@ -180,8 +243,7 @@ def build(parser: Parser, linenum: int, label: str | None,
           children: list[Node]) -> Node:
     """Construct a new non-leaf node."""
     if label == 'sizeof':
-        return Leaf('con', children[0].linenum,
-                    [Int6], [], tysize(children[0].typestr))
+        return conleaf(children[0].linenum, tysize(children[0].typestr))
 
     if label is None:
         return dofunc(parser, doarray(parser, children[0]))
@@ -225,14 +287,7 @@ def build(parser: Parser, linenum: int, label: str | None,
                             parser,
                             linenum,
                             'mult',
-                            [child,
-                             Leaf(
-                                 'con',
-                                 linenum,
-                                 [Int6],
-                                 [],
-                                 size
-                             )]
+                            [child, conleaf(linenum, size)]
                         )
 
     typestr = stdconv(children)
@@ -245,18 +300,18 @@ def build(parser: Parser, linenum: int, label: str | None,
 
     match label:
         case 'toint':
-            node.typestr = [Int6]
+            node.typestr = IntType6
             return node
         case 'toflt':
-            node.typestr = [Double6]
+            node.typestr = DoubleType6
             return node
         case 'cond':
             assert len(node.children) == 3
             _, left, right = node.children
             if left.typestr == right.typestr:
-                node.typestr = left.typestr.copy()
+                node.typestr = left.typestr
             else:
-                node.typestr = [Int6]  # ? also need floats
+                node.typestr = IntType6  # ? also need floats
             return node
         case 'deref':
             if children[0].label == 'addr':
@@ -267,9 +322,11 @@ def build(parser: Parser, linenum: int, label: str | None,
                 node.typestr = node.typestr[1:]
         case 'addr':
             if node[0].label == 'deref':
-                node = node[0][0]
-                node.typestr = node.typestr[1:]
-            node.typestr.insert(0, Point6)
+                # Copy, as the dereferenced node may be a shared leaf
+                inner = node[0][0]
+                node = replace(inner, typestr=(Point6,) + inner.typestr[1:])
+            else:
+                node.typestr = (Point6,) + node.typestr
             regchk(parser, node)
         case 'postinc' | 'preinc' | 'postdec' | 'predec':
             del node.children[1:]
@@ -277,15 +334,12 @@ def build(parser: Parser, linenum: int, label: str | None,
                 size = tysize(node.children[0].typestr[1:])
             else:
                 size = 1
-            node.children.append(Leaf(
-                'con', linenum, [Int6], [],
-                size)
-            )
+            node.children.append(conleaf(linenum, size))
         case 'dot':
             regchk(parser, node)
 
     if opinfo.isint[node.label]:
-        node.typestr = [Int6]
+        node.typestr = IntType6
 
     if opinfo.lessgreat[node.label] and pointer(*node.children) and node.label[0] != 'u':
         node.label = 'u' + node.label
@@ -299,13 +353,21 @@ def build(parser: Parser, linenum: int, label: str | None,
 def binary(parser: Parser, lesser: Callable[[Parser], Node],
            labels: dict[str, str]):
     """Handle a normal binary parse."""
+    match_set = parser.match_set
     node = lesser(parser)
-    while True:
-        token = parser.match(*labels.keys())
-        if not token:
-            return node
-        node = build(parser, token.linenum,
-                     labels[token.label], [node, lesser(parser)])
+    # Each operator is built as soon as its right operand is parsed, so its
+    # diagnostics come at the operator. Constant pairs are folded without
+    # building a Node.
+    while token := match_set(labels):
+        label = labels[token.label]
+        right = lesser(parser)
+        if node.label == 'con' and right.label == 'con':
+            result = foldcon(label, [word(node.value), word(right.value)])
+            if result is not None:
+                node = conleaf(token.linenum, result)
+                continue
+        node = build(parser, token.linenum, label, [node, right])
+    return node
 
 
 def exp15(parser: Parser) -> Node:
@@ -329,7 +391,7 @@ def exp14(parser: Parser) -> Node:
         '=^': 'asneor',
         '=|': 'asnor'
     }
-    token = parser.match(*labels.keys())
+    token = parser.match_set(labels)
     if token:
         node = build(parser, token.linenum, labels[token.label],
                      [node, exp14(parser)])
@@ -421,31 +483,36 @@ def exp2(parser: Parser) -> Node:
         'sizeof': 'sizeof',
         '*': 'deref'
     }
-    token = parser.match(*labels.keys())
-    if token:
-        node = exp2(parser)
-        if token.label == '&' and not opinfo.islval[node.label]:
-            parser.error('missing required lval')
-        return build(parser, token.linenum, labels[token.label], [node])
+    match = parser.match
+    match_set = parser.match_set
+    prefixes = []
+    while token := match_set(labels):
+        prefixes.append(token)
     node = exp1(parser)
     while True:
-        token = parser.match('++', '--')
+        token = match('++', '--')
         if not token:
-            return node
+            break
         if token.label == '++':
             label = 'postinc'
         else:
             label = 'postdec'
         node = build(parser, token.linenum, label, [node])
+    # Prefix operators bind looser than postfix ones, innermost first.
+    for token in reversed(prefixes):
+        if token.label == '&' and not opinfo.islval[node.label]:
+            parser.error('missing required lval')
+        node = build(parser, token.linenum, labels[token.label], [node])
+    return node
 
 
 def domember(parser: Parser, linenum: int, node: Node, label: str,
              member: str) -> Node:
     """Perform a '.' or '->' operation."""
-    if member not in parser.tagtab:
+    tag = parser.tagtab.get(member)
+    if tag is None:
         parser.error(f'undefined member tag {member}')
         return node
-    tag = parser.tagtab[member]
     if tag.storage != 'member':
         parser.error(f'tag {member} not a member')
         return node
@@ -454,49 +521,52 @@ def domember(parser: Parser, linenum: int, node: Node, label: str,
     else:
         label = 'dot'
     node = build(parser, linenum, label,
-                 [node, Leaf('con', linenum, [Int6], [], tag.offset)])
-    node.typestr = tag.typestr.copy()
+                 [node, conleaf(linenum, tag.offset)])
+    node.typestr = tag.typestr
     return node
 
 
 def exp1(parser: Parser) -> Node:
     """Parse a primary expression."""
-    token = parser.match('name', 'con', 'fcon', 'string', '(')
+    match = parser.match
+    token = match('name', 'con', 'fcon', 'string', '(')
     if not token:
         parser.errskip('missing primary expression')
         token = Token('con', parser.curline, 1)
     match token.label:
         case 'name':
             assert isinstance(token.value, str)
+            symtab = parser.symtab
             try:
-                symbol = parser.symtab[token.value]
+                symbol = symtab[token.value]
             except KeyError:
-                if parser.peek().label == '(':
+                if parser.peek_label() == '(':
                     symbol = Symbol(token.value,
                                     'extern',
-                                    [Func6, Int6],
+                                    (Func6, Int6),
                                     local=True)
                 else:
                     symbol = Symbol(token.value,
                                     'static',
-                                    [TypeElem('array', 1),
-                                     Int6],
+                                    LabelType6,
                                     offset=parser.nextstatic(),
                                     local=True,
                                     undefined=True)
-                parser.symtab[token.value] = symbol
-            node = Leaf('name', token.linenum, symbol.typestr.copy(),
+                symtab[token.value] = symbol
+                if not parser.localscope:
+                    parser.outerlocals.append(token.value)
+            node = Leaf('name', token.linenum, symbol.typestr,
                         [], symbol)
         case 'con':
             assert isinstance(token.value, int)
-            node = Leaf('con', token.linenum, [Int6], [], word(token.value))
+            node = conleaf(token.linenum, word(token.value))
         case 'fcon':
-            node = Leaf('fcon', token.linenum, [
-                        Double6], [], float(token.value))
+            node = Leaf('fcon', token.linenum, DoubleType6, [],
+                        float(token.value))
         case 'string':
             assert isinstance(token.value, bytes)
             node = Leaf('string', token.linenum,
-                        [TypeElem('array', len(token.value)), Char6],
+                        (typeelem('array', len(token.value)), Char6),
                         [], token.value)
         case '(':
             node = exp15(parser)
@@ -504,21 +574,19 @@ def exp1(parser: Parser) -> Node:
         case _:
             raise ValueError
     while True:
-        token = parser.match('(', '[', '->', '.')
+        token = match('(', '[', '->', '.')
         if not token:
             return node
         match token.label:
             case '(':
                 args = []
-
-                def callback(parser: Parser, token: Token) -> bool:
-                    """Add an argument to the arg list."""
-                    parser.unsee(token)
+                while not match(')'):
+                    parser.eoferror()
                     arg = exp14(parser)
-                    arg = build(parser, arg.linenum, None, [arg])
-                    args.append(arg)
-                    return True
-                parser.list(')', callback)
+                    args.append(build(parser, arg.linenum, None, [arg]))
+                    if parser.peek_label() != ')' and not parser.need(','):
+                        parser.termskip()
+                        break
                 node = build(parser, token.linenum, 'call', [node] + args)
             case '[':
                 node = build(parser, token.linenum, 'deref',
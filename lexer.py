@@ -2,14 +2,18 @@
 
 from dataclasses import dataclass, field
 import re
-from typing import Any, Iterable
+from typing import Any, Container, Iterable
 import util
 
-keywords = [
+# Each keyword maps to itself, so a keyword token's label is the shared
+# interned string rather than a new slice of the source, and comparing it
+# against a label literal is an identity check. The spec also keys 'entry',
+# which is unimplemented.
+keywords = {keyword: keyword for keyword in (
     'int', 'char', 'float', 'double', 'struct', 'auto', 'register', 'static',
     'goto', 'return', 'sizeof', 'break', 'continue', 'if', 'else', 'for',
     'do', 'while', 'switch', 'case', 'default', 'extern'
-] # The spec also keys 'entry', which is unimplemented
+)}  # type:dict[str, str]
 
 re_name = re.compile(r'[a-zA-Z_]+[a-zA-Z_0-9]*')
 re_fcon = re.compile(
@@ -17,6 +21,12 @@ re_fcon = re.compile(
 re_con = re.compile(r'[0-9]+')
 re_string = re.compile(r'"([^"]|(\\"))*"')
 re_charcon = re.compile(r"'([^']|(\\'))*'")
+re_octal = re.compile(r'[0-7][0-7]?[0-7]?')
+# One pass over names and numeric constants; fcon is tried before con so a
+# float's integer part is not taken as a constant by itself.
+re_terminal = re.compile(
+    f'(?P<name>{re_name.pattern})|(?P<fcon>{re_fcon.pattern})'
+    f'|(?P<con>{re_con.pattern})')
 
 operators = sorted([
     '{', '}', ';',
@@ -37,6 +47,14 @@ operators = sorted([
     '(', ')', '[', ']', '.', '->'
 ], key=len, reverse=True)
 
+# Operators of two or more characters, keyed by their first two characters
+# and longest first, so recognizing an operator is one or two dict lookups.
+opprefixes = {}  # type:dict[str, list[str]]
+for _operator in operators:
+    if len(_operator) > 1:
+        opprefixes.setdefault(_operator[:2], []).append(_operator)
+opsingles = frozenset(op for op in operators if len(op) == 1)
+
 
 @dataclass(frozen=True)
 class Token:
@@ -74,6 +92,16 @@ class Tokenizer(Iterable[Token]):
         self.unsee(token)
         return token
 
+    def peek_label(self) -> str:
+        """Return just the label of the next token, leaving it in the input
+        stream.
+        """
+        if self._peeked:
+            return self._peeked[-1].label
+        token = next(self)
+        self._peeked.append(token)
+        return token.label
+
     def match(self, *labels: str) -> Token | None:
         """Try to match one of the given labels to the given token. If we
         match, return the matched token. Else, return the token ot the input
@@ -85,17 +113,21 @@ class Tokenizer(Iterable[Token]):
         self.unsee(token)
         return None
 
+    def match_set(self, labels: Container[str]) -> Token | None:
+        """Like match, but takes the labels as one prebuilt container, such
+        as a frozenset or dict, so callers don't build a tuple every call.
+        """
+        token = next(self)
+        if token.label in labels:
+            return token
+        self._peeked.append(token)
+        return None
+
     @property
     def curline(self) -> int:
         """Return the current input line number."""
         return self._curline
 
-    @property
-    def text(self) -> str:
-        """Return the source text from the current internal index onwards."""
-        assert self._i >= 0
-        return self._source[self._i:]
-
     def __iter__(self) -> Iterable[Token]:
         return self
 
@@ -107,13 +139,14 @@ class Tokenizer(Iterable[Token]):
 
     def dochar(self) -> bytes:
         """Return the next input character, with escape support."""
-        if len(self.text) < 1:
-            return ''
-        if self.text[0] == '\\':
+        source = self._source
+        if self._i >= len(source):
+            return b''
+        if source[self._i] == '\\':
             self._i += 1
-            if len(self.text) < 1:
-                return ''
-            match self.text[0]:
+            if self._i >= len(source):
+                return b''
+            match source[self._i]:
                 case 'b':
                     self._i += 1
                     return b'\b'
@@ -127,75 +160,80 @@ class Tokenizer(Iterable[Token]):
                     self._i += 1
                     return b'\t'
                 case '0' | '1' | '2' | '3' | '4' | '5' | '6' | '7':
-                    match = re.match(r'[0-7][0-7]?[0-7]?', self.text)
+                    match = re_octal.match(source, self._i)
                     if not match:
                         raise ValueError(
                             "FATAL UNABLE TO MATCH CHAR CON OCTAL")
                     self._i += len(match[0])
                     return bytes([int(match[0], base=8)])
                 case _:
-                    char = self.text[0].encode(encoding='ascii')
+                    char = source[self._i].encode(encoding='ascii')
                     self._i += 1
                     return char
         else:
-            char = self.text[0].encode(encoding='ascii')
+            char = source[self._i].encode(encoding='ascii')
             self._i += 1
             return char
 
     def whitespace(self) -> None:
         """Skip leading whitespace."""
-        while len(self.text) > 0:
-            match self.text[0]:
+        source = self._source
+        end = len(source)
+        i = self._i
+        while i < end:
+            match source[i]:
                 case '@':
                     self._countlines = not self._countlines
-                    self._i += 1
+                    i += 1
                 case '\n':
                     if self._countlines:
                         self._curline += 1
-                    self._i += 1
+                    i += 1
                 case ' ' | '\t':
-                    self._i += 1
+                    i += 1
                 case _:
-                    if self.text.startswith('/*'):
-                        self._i += 2
-                        while len(self.text) > 0 and \
-                                not self.text.startswith('*/'):
-                            if self._countlines and self.text[0] == '\n':
-                                self._curline += 1
-                            self._i += 1
-                        self._i += 2
+                    if source.startswith('/*', i):
+                        close = source.find('*/', i + 2)
+                        if close < 0:
+                            close = end
+                        if self._countlines:
+                            self._curline += source.count('\n', i + 2, close)
+                        i = close + 2
                     else:
-                        return
+                        break
+        self._i = i
 
     def __next__(self) -> Token:  # pylint:disable=too-many-return-statements
         if len(self._peeked) > 0:
             return self._peeked.pop()
 
         self.whitespace()
-        if len(self.text) < 1:
+        source = self._source
+        i = self._i
+        if i >= len(source):
             return self._token('eof')
 
-        for operator in operators:
-            if self.text.startswith(operator):
+        for operator in opprefixes.get(source[i:i+2], ()):
+            if source.startswith(operator, i):
                 self._i += len(operator)
                 return self._token(operator)
+        if source[i] in opsingles:
+            self._i += 1
+            return self._token(source[i])
 
-        match = re_name.match(self.text)
-        if match:
-            self._i += len(match[0])
-            if match[0] in keywords:
-                return self._token(match[0])
-            return self._token('name', match[0])
-
-        match = re_fcon.match(self.text)
-        if match:
-            self._i += len(match[0])
-            return self._token('fcon', float(match[0]))
-
-        match = re_con.match(self.text)
+        match = re_terminal.match(source, i)
         if match:
-            self._i += len(match[0])
-            digits = match[0]
+            self._i = match.end()
+            kind = match.lastgroup
+            text = match[kind]
+            if kind == 'name':
+                keyword = keywords.get(text)
+                if keyword is not None:
+                    return self._token(keyword)
+                return self._token('name', text)
+            if kind == 'fcon':
+                return self._token('fcon', float(text))
+            digits = text
             if digits[0] == '0':
                 base = 8
             else:
@@ -205,27 +243,33 @@ class Tokenizer(Iterable[Token]):
                 num = util.word(num * base + int(digit))
             return self._token('con', num)
 
-        if self.text[0] == "'":
+        if source[i] == "'":
             self._i += 1
             con = 0
-            while len(self.text) > 0:
-                if self.text[0] == "'":
+            while self._i < len(source):
+                if source[self._i] == "'":
                     self._i += 1
                     break
                 con = (con << 8) | (self.dochar()[0] & 0xFF)
             return self._token('con', con)
 
-        if self.text[0] == '"':
-            text = bytes()
+        if source[i] == '"':
+            text = bytearray()
             self._i += 1
-            while len(self.text) > 0:
-                if self.text[0] == '"':
+            while self._i < len(source):
+                char = source[self._i]
+                if char == '"':
+                    self._i += 1
+                    text.append(0)
+                    return self._token('string', bytes(text))
+                if char == '\\':
+                    text += self.dochar()
+                else:
+                    # Fast path for the common unescaped character
+                    text.append(ord(char))
                     self._i += 1
-                    text += bytes([0])
-                    return self._token('string', text)
-                text += self.dochar()
 
-        util.error(self, f'bad input character {repr(self.text[0])}')
+        util.error(self, f'bad input character {repr(source[i])}')
         self._i += 1
         return next(self)
 
@@ -3,21 +3,29 @@
 from __future__ import annotations
 from dataclasses import dataclass, field
 from enum import IntFlag
+from functools import cache
 import struct
 from util import word
 
 NAMELEN = 8
 
-STRUCT_HEADER = "<HHH"
-STRUCT_BYTE = "<b"
-STRUCT_UBYTE = "<B"
-STRUCT_WORD = "<H"
-STRUCT_NAME = f"<{NAMELEN}s"
+STRUCT_HEADER = struct.Struct("<HHH")
+STRUCT_WORD = struct.Struct("<H")
+STRUCT_SYMBOL = struct.Struct(f"<{NAMELEN}sHB")
+STRUCT_REFERENCE = struct.Struct(f"<b{NAMELEN}sH")
 
 
+@cache
 def bytename(name: str) -> bytes:
-    """Properly encode a bytes representation of a symbol name."""
-    return (name + '\x00' * NAMELEN)[:NAMELEN].encode('ascii')
+    """Properly encode a bytes representation of a symbol name. Names repeat
+    across symbols and references, so the encodings are cached.
+    """
+    return name.encode('ascii').ljust(NAMELEN, b'\x00')[:NAMELEN]
+
+
+def namestr(namebytes: bytes) -> str:
+    """Decode a symbol name from its padded bytes representation."""
+    return namebytes.rstrip(b'\x00').decode('ascii')
 
 
 class SymFlag(IntFlag):
@@ -49,10 +57,14 @@ class Symbol:
         return bool(self.flags & SymFlag.COMMON)
 
     def __bytes__(self) -> bytes:
-        return struct.pack(f"<{NAMELEN}sHB",
-                           bytename(self.name),
-                           self.value,
-                           self.flags)
+        return STRUCT_SYMBOL.pack(bytename(self.name),
+                                  self.value,
+                                  self.flags)
+
+    def pack_into(self, buffer: bytearray, offset: int) -> None:
+        """Write the bytes representation into the buffer at the offset."""
+        STRUCT_SYMBOL.pack_into(buffer, offset, bytename(self.name),
+                                self.value, self.flags)
 
     def copy(self) -> Symbol:
         """Return a duplicate of the symbol"""
@@ -91,45 +103,39 @@ class Reference:
         return 2
 
     def __bytes__(self) -> bytes:
-        return struct.pack(f"<b{NAMELEN}sH",
-                           -(self.flags | RefFlag.ALWAYS_SET),
-                           bytename(self.name),
-                           self.con)
-
-    def resolve(self, offset: int, *symtabs: dict[str, Symbol]) -> bytes:
+        return STRUCT_REFERENCE.pack(-(self.flags | RefFlag.ALWAYS_SET),
+                                     bytename(self.name),
+                                     self.con)
+
+    def pack_into(self, buffer: bytearray, offset: int) -> None:
+        """Write the bytes representation into the buffer at the offset."""
+        STRUCT_REFERENCE.pack_into(buffer, offset,
+                                   -(self.flags | RefFlag.ALWAYS_SET),
+                                   bytename(self.name), self.con)
+
+    def resolve(self, offset: int,
+                symtab: dict[str, Symbol] | None = None) -> bytes:
         """Resolve the reference, returning its byte value."""
-        mode = ''
-        if self.flags & RefFlag.HILO:
-            if self.flags & RefFlag.HI:
-                mode = 'hi'
-            else:
-                mode = 'lo'
-        isword = not self.flags & RefFlag.BYTE
-
-        if self.flags & RefFlag.SYMBOL:
-            found = False
-            for symtab in symtabs:
-                if self.name in symtab:
-                    symbol = symtab[self.name]
-                    if symbol.flags & SymFlag.COMMON:
-                        raise ValueError('illegal common')
-                    data = self.con + symbol.value
-                    found = True
-                    break
-            if not found:
+        flags = int(self.flags)
+
+        if flags & RefFlag.SYMBOL:
+            symbol = symtab.get(self.name) if symtab is not None else None
+            if symbol is None:
                 raise ValueError('undefined symbol', self.name)
+            if symbol.flags & SymFlag.COMMON:
+                raise ValueError('illegal common')
+            data = self.con + symbol.value
         else:
             data = offset + self.con
-        assert isinstance(data, int)
-        data = word(data).to_bytes(2, 'little')
-        assert len(data) == 2
-        if mode == 'hi':
-            data = bytes([data[1], 0])
-        elif mode == 'lo':
-            data = bytes([data[0], 0])
-        if isword:
-            return data
-        return bytes([data[0]])
+        data = word(data)
+        if flags & RefFlag.HILO:
+            if flags & RefFlag.HI:
+                data >>= 8
+            else:
+                data &= 0xFF
+        if flags & RefFlag.BYTE:
+            return bytes((data & 0xFF,))
+        return data.to_bytes(2, 'little')
 
 
 @dataclass
@@ -142,45 +148,34 @@ class Module:
 
     def from_bytes(self, source: bytes) -> Module:
         """Parse the module from some source bytes."""
-        textlen, datalen, bsslen = struct.unpack_from(STRUCT_HEADER,
-                                                      source,
-                                                      0)
-        i = 6
-        text, i = self._inseg(source, i)
-        if self.seglen(text) != textlen:
-            raise ValueError(self.seglen(text), textlen)
-        data, i = self._inseg(source, i)
-        if self.seglen(data) != datalen:
+        # Parse through a view so reads and slices don't copy the source.
+        source = memoryview(source)
+        textlen, datalen, bsslen = STRUCT_HEADER.unpack_from(source, 0)
+        i = STRUCT_HEADER.size
+        text, seglen, i = self._inseg(source, i)
+        if seglen != textlen:
+            raise ValueError(seglen, textlen)
+        data, seglen, i = self._inseg(source, i)
+        if seglen != datalen:
             raise ValueError
         symtab, i = self._insyms(source, i)
 
         return Module(text, data, symtab, bsslen)
 
-    def _inname(self, source: bytes, i: int) -> tuple[str, int]:
-        """Read in a symbol name at the current position, returning it as a
-        Python string and the new source offset 'i'.
-        """
-        namebytes = struct.unpack_from(STRUCT_NAME, source, i)[0]
-        assert isinstance(namebytes, bytes)
-        i += NAMELEN
-        namebytes = namebytes.rstrip(b'\x00')
-        return namebytes.decode('ascii'), i
-
-    def _insyms(self, source: bytes, i: int) -> tuple[dict[str, Symbol], int]:
+    def _insyms(self, source: memoryview,
+                i: int) -> tuple[dict[str, Symbol], int]:
         """Read in the symbol table from the source bytes at the given i
         index, returning the symbol table and the new index.
         """
+        # Find the terminator first, then unpack the fixed-size entries in bulk
+        end = i
+        while source[end] != 0:
+            end += STRUCT_SYMBOL.size
+
         symtab: dict[str, Symbol] = {}
-        while True:
-            if source[i] == 0:
-                return symtab, i
-            name, i = self._inname(source, i)
-            value = struct.unpack_from(STRUCT_WORD, source, i)[0]
-            assert isinstance(value, int)
-            i += 2
-            flags = struct.unpack_from(STRUCT_UBYTE, source, i)[0]
-            assert isinstance(flags, int)
-            i += 1
+        for namebytes, value, flags in STRUCT_SYMBOL.iter_unpack(
+                source[i:end]):
+            name = namestr(namebytes)
 
             symbol = Symbol(
                 SymFlag(flags),
@@ -190,38 +185,43 @@ class Module:
             if symbol.name in symtab:
                 raise ValueError('redefined symbol', symbol)
             symtab[symbol.name] = symbol
+        return symtab, end
 
-    def _inseg(self, source: bytes,
-               i: int) -> tuple[list[bytes | Reference], int]:
-        """Read the segment in from the source bytes, returning the new index
-        into the bytes, and the parsed segment.
+    def _inseg(self, source: memoryview,
+               i: int) -> tuple[list[bytes | Reference], int, int]:
+        """Read the segment in from the source bytes, returning the parsed
+        segment, its length in bytes, and the new index into the bytes.
         """
         seg: list[bytes | Reference] = []
+        seglen = 0
         while True:
-            count = struct.unpack_from(STRUCT_BYTE, source, i)[0]
+            count = source[i]
+            if count > 127:
+                count -= 256
             i += 1
             if count > 0:
-                seg.append(source[i:i+count])
+                seg.append(bytes(source[i:i+count]))
+                seglen += count
                 i += count
             elif count < 0:
                 ref, i = self._inref(-count, source, i)
                 seg.append(ref)
+                seglen += len(ref)
             else:
                 break
-        return seg, i
+        return seg, seglen, i
 
-    def _inref(self, flags: int, source: bytes,
+    def _inref(self, flags: int, source: memoryview,
                i: int) -> tuple[Reference, int]:
         """Read a references at the given i position in the source bytes.
         Return the reference and a new i value after it.
         """
-        flags = RefFlag(flags)
         if flags & RefFlag.SYMBOL:
-            symbol, i = self._inname(source, i)
+            symbol = namestr(source[i:i+NAMELEN].tobytes())
+            i += NAMELEN
         else:
             symbol = ''
-        con = struct.unpack_from(STRUCT_WORD, source, i)[0]
-        assert isinstance(con, int)
+        con = STRUCT_WORD.unpack_from(source, i)[0]
         i += 2
 
         return Reference(RefFlag(flags), symbol, con), i
@@ -232,26 +232,47 @@ class Module:
         return sum((len(elem) for elem in seg))
 
     def __bytes__(self):
-        out = struct.pack("<HHH",
-                          self.seglen(self.text),
-                          self.seglen(self.data),
-                          self.bss_len)
-        for seg in self.text, self.data:
+        segs = self.text, self.data
+
+        # Size the output first so it can be written in place. Literal bytes
+        # are split into records of at most 127 bytes, each with a count.
+        seglens = []
+        size = STRUCT_HEADER.size
+        for seg in segs:
+            seglen = 0
+            for elem in seg:
+                if isinstance(elem, bytes):
+                    size += len(elem) + -(-len(elem) // 127)
+                else:
+                    size += STRUCT_REFERENCE.size
+                seglen += len(elem)
+            seglens.append(seglen)
+            size += 1
+        size += STRUCT_SYMBOL.size * len(self.symtab) + 1
+
+        out = bytearray(size)
+        STRUCT_HEADER.pack_into(out, 0, *seglens, self.bss_len)
+        pos = STRUCT_HEADER.size
+        for seg in segs:
             for elem in seg:
                 if isinstance(elem, bytes):
                     for i in range(0, len(elem), 127):
                         cut = elem[i:i+127]
-                        out += bytes([len(cut)]) + cut
+                        out[pos] = len(cut)
+                        out[pos+1:pos+1+len(cut)] = cut
+                        pos += 1 + len(cut)
                 elif isinstance(elem, Reference):
-                    out += bytes(elem)
+                    elem.pack_into(out, pos)
+                    pos += STRUCT_REFERENCE.size
                 else:
                     raise TypeError(elem)
-            out += b'\x00'
+            pos += 1  # Zero terminator
         for symbol in self.symtab.values():
-            out += bytes(symbol)
-        out += b'\x00'
+            symbol.pack_into(out, pos)
+            pos += STRUCT_SYMBOL.size
+        assert pos + 1 == size
 
-        return out
+        return bytes(out)
 
 
 class Linker:
@@ -269,25 +290,29 @@ class Linker:
         """Link the symbol table."""
         self.buildsyms()
 
-        out = bytes()
+        out = bytearray()
         for seg in ('text', 'data'):
             for i, module in enumerate(self.modules):
                 out += self.resolve(len(out), self.modsyms[i],
                                     getattr(module, seg))
-        return out + bytes(self.bsslen)
+        out += bytes(self.bsslen)
+        return bytes(out)
 
     def resolve(self, offset: int, modsym: dict[str, Symbol],
                 seg: list[bytes | Reference]) -> bytes:
         """Resolve all references in a given segment."""
-        out = bytes()
+        # Module symbols take priority over the global ones.
+        symtab = self.symtab | modsym
+        out = bytearray()
         for elem in seg:
             if isinstance(elem, bytes):
                 out += elem
             elif isinstance(elem, Reference):
-                out += elem.resolve(offset+len(out), modsym, self.symtab)
+                out += elem.resolve(offset, symtab)
             else:
                 raise TypeError(elem)
-        return out
+            offset += len(elem)
+        return bytes(out)
 
     def buildsyms(self) -> None:
         """Construct the symbol table."""
@@ -297,22 +322,28 @@ class Linker:
             self.modsyms.append({})
         offset = 0
 
+        # Gather each module's segment lengths and its symbols grouped by
+        # segment number once, rather than rescanning them per segment.
+        seglens: list[tuple[int, int, int]] = []
+        segsyms: list[tuple[list[Symbol], ...]] = []
+        for module in self.modules:
+            seglens.append((module.seglen(module.text),
+                            module.seglen(module.data),
+                            module.bss_len))
+            groups: tuple[list[Symbol], ...] = ([], [], [], [])
+            for symbol in module.symtab.values():
+                groups[symbol.flags & SymFlag.SEG].append(symbol)
+            segsyms.append(groups)
+
         for seg in ('text', 'data', 'bss'):
             segnum = SEGS[seg]
-            for i, module in enumerate(self.modules):
-                modsym: list[Symbol] = []
-                for symbol in module.symtab.values():
-                    if (symbol.flags & SymFlag.SEG) != segnum:
-                        continue
+            for i, modsym in enumerate(self.modsyms):
+                for symbol in segsyms[i][segnum]:
                     newsym = symbol.copy()
                     if not newsym.common:
                         newsym.value += offset
-                    modsym.append(newsym)
-                if seg == 'bss':
-                    offset += module.bss_len
-                else:
-                    offset += module.seglen(getattr(module, seg))
-                self.modsyms[i].update({sym.name: sym for sym in modsym})
+                    modsym[newsym.name] = newsym
+                offset += seglens[i][segnum]
             match seg:
                 case 'text' | 'data':
                     self.symtab[f'_e{seg}'] = Symbol(SymFlag.EXPORT,
@@ -44,3 +44,7 @@ islval = Flags(
 nopointconv = Flags(
     *assign.keys(), *compare.keys()
 )
+
+sideeffect = Flags(
+    *assign.keys(), 'preinc', 'postinc', 'predec', 'postdec', 'call'
+)
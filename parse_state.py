@@ -2,9 +2,9 @@
 
 from __future__ import annotations
 from dataclasses import dataclass, field
-from typing import Callable, NoReturn
+from typing import Callable, Container, NoReturn
 from lexer import Token, Tokenizer
-from symtab import Symbol
+from symtab import StorageClass, Symbol
 import util
 
 
@@ -14,8 +14,11 @@ class Parser:
     tokenizer: Tokenizer
     symtab: dict[str, Symbol] = field(default_factory=dict)
     tagtab: dict[str, Symbol] = field(default_factory=dict)
-    asm: str = ''
+    asmbuf: list[str] = field(default_factory=list)
     localscope: bool = False
+    defstorage: StorageClass = 'extern'
+    symmark: int = 0
+    tagmark: int = 0
     curstatic: int = 0
     brkstk: list[str] = field(default_factory=list)
     contstk: list[str] = field(default_factory=list)
@@ -23,14 +26,54 @@ class Parser:
     defaultstk: list[str | None] = field(default_factory=list)
     curseg: str = ''
     strings: dict[str, bytes] = field(default_factory=dict)
-
-    def cleartab(self, table: dict[str, Symbol]) -> None:
-        """Clear locals from a given table."""
-        for name, symbol in table.copy().items():
-            if symbol.local:
-                if symbol.undefined:
-                    self.error(f'undefined symbol {name}')
-                del table[name]
+    # Names of locals made outside local scope, such as a name used in a
+    # global initializer before being declared
+    outerlocals: list[str] = field(default_factory=list)
+    # The token methods run for every token and would only forward to the
+    # tokenizer's, so __post_init__ binds the tokenizer's methods directly.
+    # See Tokenizer for what each does.
+    match: Callable[..., Token | None] = field(
+        init=False, repr=False, compare=False)
+    match_set: Callable[[Container[str]], Token | None] = field(
+        init=False, repr=False, compare=False)
+    peek: Callable[[], Token] = field(init=False, repr=False, compare=False)
+    peek_label: Callable[[], str] = field(
+        init=False, repr=False, compare=False)
+    unsee: Callable[[Token], None] = field(
+        init=False, repr=False, compare=False)
+
+    def cleartab(self, table: dict[str, Symbol], mark: int,
+                 outer: list[str] | None = None) -> None:
+        """Clear locals from a given table.
+
+        Every entry made in local scope is a local, and entries are never
+        replaced, so those locals are exactly the entries after the table's
+        length at the mark. Popping them means only the locals are walked,
+        not the whole table. Locals made outside local scope sit before the
+        mark, so they are passed by name in outer.
+        """
+        localsyms = []
+        while len(table) > mark:
+            localsyms.append(table.popitem())
+        localsyms.reverse()
+        outersyms = []
+        for name in outer or ():
+            symbol = table.get(name)
+            if symbol is not None and symbol.local:
+                outersyms.append((name, table.pop(name)))
+        # The outer locals were made first, so they are reported first
+        for name, symbol in outersyms + localsyms:
+            assert symbol.local
+            if symbol.undefined:
+                self.error(f'undefined symbol {name}')
+
+    def enterlocal(self) -> None:
+        """Enter local scope."""
+        assert not self.localscope
+        self.symmark = len(self.symtab)
+        self.tagmark = len(self.tagtab)
+        self.localscope = True
+        self.defstorage = 'auto'
 
     def exitlocal(self) -> None:
         """Exit local scope."""
@@ -41,10 +84,12 @@ class Parser:
         self.casestk.clear()
         self.defaultstk.clear()
 
-        self.cleartab(self.symtab)
-        self.cleartab(self.tagtab)
+        self.cleartab(self.symtab, self.symmark, self.outerlocals)
+        self.outerlocals.clear()
+        self.cleartab(self.tagtab, self.tagmark)
 
         self.localscope = False
+        self.defstorage = 'extern'
 
     def nextstatic(self) -> str:
         """Return the next static label."""
@@ -54,6 +99,16 @@ class Parser:
 
     def __post_init__(self):
         self.errs = 0
+        self.match = self.tokenizer.match
+        self.match_set = self.tokenizer.match_set
+        self.peek = self.tokenizer.peek
+        self.peek_label = self.tokenizer.peek_label
+        self.unsee = self.tokenizer.unsee
+
+    @property
+    def asm(self) -> str:
+        """Return the assembly output so far."""
+        return ''.join(self.asmbuf)
 
     @property
     def errcount(self) -> int:
@@ -65,23 +120,6 @@ class Parser:
         """Return the current input line."""
         return self.tokenizer.curline
 
-    def match(self, *labels: str) -> Token | None:
-        """If any of the labels match the next input token, return the
-        matched token. Else, return the token to the input stream and return
-        None.
-        """
-        return self.tokenizer.match(*labels)
-
-    def peek(self) -> Token:
-        """Return the next token, also placing it back in the input stream to
-        be read again.
-        """
-        return self.tokenizer.peek()
-
-    def unsee(self, token: Token) -> None:
-        """Return the given token to the input stream, to be seen again."""
-        self.tokenizer.unsee(token)
-
     def __next__(self) -> Token:
         return next(self.tokenizer)
 
@@ -109,26 +147,9 @@ class Parser:
         if self.match('eof'):
             self.crash('unexpected end of file')
 
-    def list(self, endlabel: str,
-             callback: Callable[[Parser, Token], bool],
-             seplabel: str = ',',
-             errmsg: str | None = 'syntax error') -> None:
-        """Process a seperated list of elements. After seeing each
-        element token, run the callback. If the callback returns False, end
-        the list search immediately.
-        """
-        while not self.match(endlabel):
-            self.eoferror()
-            if not callback(self, next(self.tokenizer)):
-                break
-            if not self.peek().label == endlabel:
-                if not self.need(seplabel, msg=errmsg):
-                    self.termskip()
-                    break
-
     def termskip(self) -> None:
         """Skip to a terminal input token, used with errskip."""
-        while self.peek().label not in (';', '{', '}', 'eof'):
+        while self.peek_label() not in (';', '{', '}', 'eof'):
             next(self.tokenizer)
 
     def errskip(self, msg: str, line: int | None = None) -> None:
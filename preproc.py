@@ -1,27 +1,32 @@
 """C6T - C version 6 by Troy - Preprocessor"""
 
 from pathlib import Path, PurePosixPath
-from collections import deque
+from itertools import chain
 from typing import Iterable, Iterator
 import re
 
 import util
 
 
+# Matches a string or character constant (kept as is) or a comment. An
+# unterminated comment runs to the end of the text.
+re_comment = re.compile(
+    r'("(?:[^"\\\n]|\\.)*"|\'(?:[^\'\\\n]|\\.)*\')|/\*.*?(?:\*/|\Z)',
+    re.DOTALL)
+
+
+def _uncomment(match: re.Match) -> str:
+    """Replace a comment with just its newlines, leaving constants alone."""
+    if match[1] is not None:
+        return match[1]
+    return '\n' * match[0].count('\n')
+
+
 def strip_comments(text: str) -> str:
-    """Return a version of the text with C6T comments stripped out."""
-    out = ''
-    i = 0
-    while i < len(text):
-        if text[i:].startswith('/*'):
-            i += 2
-            while i < len(text) and not text[i:].startswith('*/'):
-                i += 1
-            i += 2
-        else:
-            out += text[i]
-            i += 1
-    return out
+    """Return a version of the text with C6T comments stripped out. Newlines
+    inside comments are kept, so line numbers don't change.
+    """
+    return re_comment.sub(_uncomment, text)
 
 
 class Includer(Iterable[str]):
@@ -30,8 +35,9 @@ class Includer(Iterable[str]):
     """
 
     def __init__(self, source: str):
-        self._lines = deque(source.splitlines(
-            keepends=True))  # type:deque[str]
+        # Line iterators for each open source, the innermost last
+        self._stack = [iter(source.splitlines(
+            keepends=True))]  # type:list[Iterator[str]]
         self.errs = 0
         self.in_include = False
 
@@ -45,62 +51,72 @@ class Includer(Iterable[str]):
             util.error(self,
                        f'unable to open file "{PurePosixPath(filename)}"',
                        line)
-        self._lines = deque(['@'] + path.read_text('utf8').splitlines(
-            keepends=True) + ['@'] + list(self._lines))
+        text = strip_comments(path.read_text('utf8'))
+        self._stack.append(chain(
+            ('@',), text.splitlines(keepends=True), ('@',)))
 
     def insert(self, line: str) -> None:
         """Insert the line to the front of our list."""
-        self._lines.insert(0, line)
+        self._stack.append(iter((line,)))
 
     def __next__(self) -> str:
         """Return the next line from the input.
         """
-        try:
-            line = self._lines.popleft()
-        except IndexError as error:
-            raise StopIteration from error
-        if line == '@':
-            self.in_include = not self.in_include
-        return line
+        while self._stack:
+            try:
+                line = next(self._stack[-1])
+            except StopIteration:
+                self._stack.pop()
+                continue
+            if line == '@':
+                self.in_include = not self.in_include
+            return line
+        raise StopIteration
 
     def __iter__(self) -> Iterator[str]:
         return self
 
 
-re_replacer = re.compile(r'([a-zA-Z_]+[a-zA-Z_0-9]*)|([^a-zA-Z_]+)')
+def macro_pattern(macros: dict[str, str]) -> re.Pattern | None:
+    """Compile a pattern matching any of the macro names as a whole name, or
+    None if there are no macros.
+    """
+    if not macros:
+        return None
+    names = '|'.join(re.escape(name)
+                     for name in sorted(macros, key=len, reverse=True))
+    return re.compile(f'(?<![a-zA-Z_0-9])(?:{names})(?![a-zA-Z_0-9])')
 
 
-def replace(inline: str, macros: dict[str, str]) -> str:
-    """Return a version of the line with macros replaced.
+def replace(inline: str, macros: dict[str, str],
+            pattern: re.Pattern | None) -> str:
+    """Return a version of the line with macros replaced, using the pattern
+    from macro_pattern.
     """
 
     #   #define error ... \n cerror, should NOT result in c...
 
-    line = ''
-    for match in re_replacer.finditer(inline, 0):
-        name, other = match.groups(None)
-        if name is None:
-            line += other
-        else:
-            if name in macros:
-                line += macros[name]
-            else:
-                line += name
-    return line
+    if pattern is None:
+        return inline
+    return pattern.sub(lambda match: macros[match[0]], inline)
 
 
 def preproc(source: str) -> str:  # pylint:disable=too-many-branches
     r"""Return a preprocessed version of the source code.
 
-    >>> path = Path('test.c')
-    >>> preproc(path.read_text())
-    '\n\n/* testing */\n\n\n\n\n@int foo, bar;\n@\nint foobar[]  foo  ,  bar ;\n'
+    Comments are replaced by just their newlines, so line numbers don't
+    change:
+
+    >>> preproc('#define N 10\n/* a\ncomment */\nint x[N];\n')
+    '\n\n\nint x[ 10 ];\n'
     """
     if source[0] != '#':
         return source
     macros = {}  # type:dict[str, str]
-    lines = Includer(source)
-    out = ''
+    pattern = None
+    stale = False
+    lines = Includer(strip_comments(source))
+    out = []  # type:list[str]
     curline = 0
     countlines = True
 
@@ -110,7 +126,7 @@ def preproc(source: str) -> str:  # pylint:disable=too-many-branches
         if countlines:
             curline += line.count('\n')
         if line.startswith('#'):
-            out += '\n'
+            out.append('\n')
             line = line[1:].strip()
             if line.startswith('define'):
                 elems = line.split(maxsplit=2)
@@ -120,7 +136,8 @@ def preproc(source: str) -> str:  # pylint:disable=too-many-branches
                 if elems[1] in macros:
                     util.error(lines, f'macro {elems[1]} already defined')
                 else:
-                    macros[elems[1]] = ' ' + strip_comments(elems[2]) + ' '
+                    macros[elems[1]] = ' ' + elems[2] + ' '
+                    stale = True
             elif line.startswith('include'):
                 match = re.match(r'^include\s+"([^"]*)"\s*$', line)
                 if match:
@@ -128,8 +145,16 @@ def preproc(source: str) -> str:  # pylint:disable=too-many-branches
                 else:
                     util.error(lines, 'bad include', curline)
         else:
-            out += replace(line, macros)
-    return out
+            if stale:
+                # Compile once per run of defines, not once per define
+                pattern = macro_pattern(macros)
+                stale = False
+            if pattern is None:
+                # Nothing defined yet, so the line passes through as is
+                out.append(line)
+            else:
+                out.append(replace(line, macros, pattern))
+    return ''.join(out)
 
 
 if __name__ == "__main__":
@@ -1,14 +1,13 @@
 """C6T - C version 6 by Troy - Specifier Parsing and Support Code"""
 
-from math import ceil
 from typing import Callable
-from assembly import asm, deflab, fasm, goseg, pseudo
-from expr import Leaf, Node, conexpr, expression
-from lexer import Token
+from assembly import asmop, dcbytes, deflab, fasm, goseg, pseudo
+from expr import Leaf, Node, conexpr, conleaf, expression
 from parse_state import Parser
 from statement import statement
 from symtab import StorageClass, Symbol
-from type6 import BaseType, Double6, Func6, Int6, Point6, TypeElem, TypeString, tysize
+from type6 import (BaseType, basetypes, Double6, Func6, Int6, IntType6, Point6,
+                   TypeElem, TypeString, tysize, typeelem)
 import util
 
 
@@ -25,7 +24,7 @@ def dostruct(parser: Parser) -> int:
             tempname = name
             tempsize = 0
             parser.tagtab[name] = Symbol(
-                name, 'struct', [TypeElem('struct', tempsize)],
+                name, 'struct', (typeelem('struct', tempsize),),
                 tempsize, parser.localscope
             )
     else:
@@ -38,11 +37,12 @@ def dostruct(parser: Parser) -> int:
         """Callback for one member spec."""
         nonlocal offset
 
-        if name in parser.tagtab:
-            check = parser.tagtab[name]
+        size = tysize(typestr)
+        check = parser.tagtab.get(name)
+        if check is not None:
             if check.storage == 'member' and check.typestr == typestr and \
                     check.offset == offset:
-                offset += tysize(typestr)
+                offset += size
                 return True
             parser.error(f'redefined member {name}')
             return True
@@ -50,30 +50,41 @@ def dostruct(parser: Parser) -> int:
         parser.tagtab[name] = Symbol(
             name, 'member', typestr, offset, parser.localscope
         )
-        offset = util.word(tysize(typestr) + offset)
+        offset = (size + offset) & util.WORDMASK
         return True
 
     if parser.match('{'):
         anymembers = True
-        while not parser.match('}'):
-            parser.eoferror()
+        peek_label = parser.peek_label
+        while True:
+            # One lookahead checks for both the closing brace and end of file
+            label = peek_label()
+            if label == '}':
+                next(parser)
+                break
+            if label == 'eof':
+                parser.eoferror()
             if not specline(parser, True, addmember):
                 parser.termskip()
                 break
     else:
         anymembers = False
 
-    if tempname is not None:
-        del parser.tagtab[tempname]
-
     if name is not None:
-        if name in parser.tagtab:
-            if parser.tagtab[name].storage != 'struct':
+        if tempname is not None:
+            # The placeholder is the only entry under this name, so there is
+            # nothing left to look up once it's removed.
+            del parser.tagtab[tempname]
+            tag = None
+        else:
+            tag = parser.tagtab.get(name)
+        if tag is not None:
+            if tag.storage != 'struct':
                 parser.error(f'non-struct {name}')
             elif anymembers:
                 parser.error(f'redefined struct {name}')
             else:
-                offset = parser.tagtab[name].offset
+                offset = tag.offset
                 assert isinstance(offset, int)
         else:
             if not anymembers:
@@ -82,7 +93,7 @@ def dostruct(parser: Parser) -> int:
                 parser.tagtab[name] = Symbol(
                     name,
                     'struct',
-                    [TypeElem('struct', offset)],
+                    (typeelem('struct', offset),),
                     offset,
                     parser.localscope
                 )
@@ -95,17 +106,22 @@ def dostruct(parser: Parser) -> int:
 
 def grabtype(parser: Parser) -> TypeElem | None:
     """Parse a base type, if any."""
-    token = parser.match('int', 'char', 'float', 'double')
-    if token:
-        return TypeElem(token.label)
-    if parser.match('struct'):
-        return TypeElem('struct', dostruct(parser))
+    token = next(parser)
+    base = basetypes.get(token.label)
+    if base is not None:
+        return base
+    if token.label == 'struct':
+        return typeelem('struct', dostruct(parser))
+    parser.unsee(token)
     return None
 
 
+storageclasses = frozenset(('auto', 'extern', 'static', 'register'))
+
+
 def grabclass(parser: Parser) -> StorageClass | None:
     """Parse a storage class specifier, if any."""
-    token = parser.match('auto', 'extern', 'static', 'register')
+    token = parser.match_set(storageclasses)
     if token:
         return token.label
     return None
@@ -122,50 +138,72 @@ def typeclass(parser: Parser) -> tuple[BaseType | None, StorageClass | None]:
     return grabtype(parser), storage
 
 
-def _spec(parser: Parser) -> tuple[str | None, TypeString, list[str]]:
-    """Process a single specifier, returning its name, type string, and
-    parameter names. If the name is None, then we didn't see a specifier.
+# Labels that may start a type and storage class specifier
+typeclasses = frozenset(basetypes.keys() | storageclasses | {'struct'})
+
+
+def _suffixes(parser: Parser, typestr: list[TypeElem],
+              params: list[str]) -> None:
+    """Parse any function and array suffixes of a specifier, adding them to
+    the type string under construction and the parameter names.
     """
-    token = parser.match('*', '(', 'name')
-    if not token:
-        return None, [], []
-    match token.label:
-        case '*':
-            name, typestr, params = _spec(parser)
-            typestr.append(Point6)
-            return name, typestr, params
-        case '(':
-            name, typestr, params = _spec(parser)
-            parser.need(')')
-        case 'name':
-            assert isinstance(token.value, str)
-            name = token.value
-            typestr = []
-            params = []
     while True:
-        if parser.match('('):
+        token = next(parser)
+        label = token.label
+        if label == '(':
             typestr.append(Func6)
-
-            def addparam(parser: Parser, token: Token):
-                """Add a parameter to the parameter list.
-                """
+            while not parser.match(')'):
+                parser.eoferror()
+                token = next(parser)
                 if token.label != 'name':
                     parser.error('missing parameter name')
                 assert isinstance(token.value, str)
                 params.append(token.value)
-                return True
-
-            parser.list(')', addparam)
-        elif parser.match('['):
+                if parser.peek_label() != ')' and not parser.need(','):
+                    parser.termskip()
+                    break
+        elif label == '[':
             if parser.match(']'):
                 size = 1
             else:
                 size = conexpr(parser)
                 parser.need(']')
-            typestr.append(TypeElem('array', size))
+            typestr.append(typeelem('array', size))
         else:
+            parser.unsee(token)
             break
 
+
+def _spec(parser: Parser) -> tuple[str | None, list[TypeElem], list[str]]:
+    """Process a single specifier, returning its name, type string under
+    construction, and parameter names. If the name is None, then we didn't
+    see a specifier.
+    """
+    # Gather the '*' and '(' prefixes iteratively, then apply them innermost
+    # first once the name and its suffixes are parsed. Each token is read
+    # once and dispatched on, most common label first.
+    prefixes = []  # type:list[str]
+    typestr = []  # type:list[TypeElem]
+    params = []  # type:list[str]
+    while True:
+        token = next(parser)
+        label = token.label
+        if label == 'name':
+            assert isinstance(token.value, str)
+            name = token.value
+            _suffixes(parser, typestr, params)
+            break
+        if label not in ('*', '('):
+            parser.unsee(token)
+            name = None
+            break
+        prefixes.append(label)
+    for label in reversed(prefixes):
+        if label == '*':
+            typestr.append(Point6)
+        else:
+            parser.need(')')
+            _suffixes(parser, typestr, params)
     return name, typestr, params
 
 
@@ -173,8 +211,15 @@ def spec(parser: Parser, basetype: TypeElem) -> tuple[str | None, TypeString, li
     """Process a single specifier, returning its name, type string, and
     parameter names. If the name is None, then we didn't see a specifier.
     """
+    token = next(parser)
+    if token.label == 'name' and parser.peek_label() not in ('(', '['):
+        # Fast path for the common plain name, with no prefix or suffix
+        assert isinstance(token.value, str)
+        return token.value, (basetype,), []
+    parser.unsee(token)
     name, typestr, params = _spec(parser)
-    return name, typestr + [basetype], params
+    typestr.append(basetype)
+    return name, tuple(typestr), params
 
 
 def specline(parser: Parser, needtypeclass: bool,
@@ -182,41 +227,48 @@ def specline(parser: Parser, needtypeclass: bool,
                  [Parser, str, StorageClass, TypeString, list[str], int],
                  bool]) -> bool:
     """Handle a single line of specifiers."""
+    if needtypeclass and parser.peek_label() not in typeclasses:
+        # One lookahead ends a run of declarations, rather than typeclass
+        # failing to match each of its keywords in turn.
+        return False
     basetype, storage = typeclass(parser)
     if basetype is None and storage is None and needtypeclass:
         return False
     if basetype is None:
         basetype = Int6
     if storage is None:
-        if parser.localscope:
-            storage = 'auto'
-        else:
-            storage = 'extern'
+        storage = parser.defstorage
 
     count = 0
-
-    def dospec(parser: Parser, token: Token) -> bool:
-        """Lower level callback for parser.line"""
-        nonlocal count
-        parser.unsee(token)
+    while not parser.match(';'):
+        parser.eoferror()
         name, typestr, params = spec(parser, basetype)
         if name is None:
             parser.error('missing declarator')
-            return True
-        count += 1
-        return callback(parser, name, storage, typestr, params, count)
-
-    parser.list(';', dospec)
+        else:
+            count += 1
+            if not callback(parser, name, storage, typestr, params, count):
+                break
+        if parser.peek_label() != ';' and not parser.need(','):
+            parser.termskip()
+            break
     return True
 
 
+# How parameter types are promoted to the type actually passed
+paramconvs = {
+    'char': Int6, 'float': Double6, 'array': Point6
+}  # type:dict[str, TypeElem]
+
+
 def funcdef(parser: Parser, name: str, typestr: TypeString,
             params: list[str]) -> None:
     """Handles an external function definition."""
 
+    asmname = '_' + name
     goseg(parser, 'text')
-    deflab(parser, '_' + name)
-    pseudo(parser, f'export _{name}')
+    deflab(parser, asmname)
+    pseudo(parser, f'export {asmname}')
 
     functype = typestr
 
@@ -224,10 +276,9 @@ def funcdef(parser: Parser, name: str, typestr: TypeString,
         name, 'extern', functype
     )
 
-    parser.localscope = True
-    paramtypes = {}
-    for paramname in params:
-        paramtypes[paramname] = [Int6].copy()
+    parser.enterlocal()
+    # Parameters default to int; the tuple is immutable, so one is shared
+    paramtypes = dict.fromkeys(params, IntType6)  # type:dict[str, TypeString]
 
     # pylint:disable=unused-argument
     def paramcallback(parser: Parser, name: str, storage: StorageClass,
@@ -239,34 +290,32 @@ def funcdef(parser: Parser, name: str, typestr: TypeString,
             parser.error(f'parameter {name} not listed in function '
                          'parameters')
             return True
-        match typestr[0].type:
-            case 'char':
-                typestr[0] = Int6
-            case 'float':
-                typestr[0] = Double6
-            case 'array':
-                typestr[0] = Point6
-            case 'func' | 'struct':
-                parser.error('function and struct types not passable')
-                return True
-        paramtypes[name] = typestr.copy()
+        kind = typestr[0].type
+        if kind in ('func', 'struct'):
+            parser.error('function and struct types not passable')
+            return True
+        promoted = paramconvs.get(kind)
+        if promoted is not None:
+            typestr = (promoted,) + typestr[1:]
+        paramtypes[name] = typestr
         return True
     while specline(parser, True, paramcallback):
         pass
     offset = util.PARAM_OFFSET
     for paramname, ptype in paramtypes.items():
-        if paramname in parser.symtab:
-            parser.error(f'name {paramname} already defined')
-            continue
         symbol = Symbol(
             paramname,
             'auto',
-            ptype.copy(),
+            ptype,
             offset,
             local=True
         )
-        parser.symtab[paramname] = symbol
-        offset = util.word(offset + tysize(ptype))
+        # One probe both checks for and inserts the new symbol
+        if parser.symtab.setdefault(paramname, symbol) is not symbol:
+            parser.error(f'name {paramname} already defined')
+        # The parameter still takes its stack slot, so the ones after it
+        # keep their offsets either way.
+        offset = (offset + tysize(ptype)) & util.WORDMASK
 
     parser.need('{')
 
@@ -281,15 +330,16 @@ def funcdef(parser: Parser, name: str, typestr: TypeString,
             storage = 'auto'
         if typestr[0].type == 'func':
             storage = 'extern'
+        size = tysize(typestr)
         match storage:
             case 'auto':
-                auto_offset = util.word(auto_offset - tysize(typestr))
+                auto_offset = (auto_offset - size) & util.WORDMASK
                 offset = auto_offset
             case 'static':
                 offset = parser.nextstatic()
                 goseg(parser, 'bss')
                 deflab(parser, offset)
-                pseudo(parser, f'ds {tysize(typestr)}')
+                pseudo(parser, f'ds {size}')
             case 'register':
                 offset = regs
                 regs += 1
@@ -298,90 +348,95 @@ def funcdef(parser: Parser, name: str, typestr: TypeString,
         symbol = Symbol(
             name,
             storage,
-            typestr.copy(),
+            typestr,
             offset,
             local=True
         )
-        if name in parser.symtab:
+        if parser.symtab.setdefault(name, symbol) is not symbol:
             parser.error(f'redefined local {name}')
-        else:
-            parser.symtab[name] = symbol
         return True
     while specline(parser, True, localcallback):
         pass
 
     goseg(parser, 'text')
 
-    asm(parser, f'useregs {regs}')
+    asmop(parser, 'useregs', regs)
 
-    pseudo(parser, f'func _{name}')
+    pseudo(parser, f'func {asmname}')
 
     if auto_offset != 0:
-        asm(parser, f'lenautos {util.word(-auto_offset)}')
+        asmop(parser, 'lenautos', -auto_offset & util.WORDMASK)
 
-    while not parser.match('}'):
-        parser.eoferror()
-        statement(parser, functype[1].floating)
+    match = parser.match
+    eoferror = parser.eoferror
+    floating = functype[1].floating
+    while not match('}'):
+        eoferror()
+        statement(parser, floating)
 
-    fasm(parser, 'retnull', functype[1].floating)
+    fasm(parser, 'retnull', floating)
 
     parser.exitlocal()
 
 
+# The initializer storage command character for each non-array type
+storecmds = {
+    'float': 'f', 'double': 'd', 'char': 'c',
+    'point': 'w', 'int': 'w', 'struct': 'w', 'func': 'w'
+}  # type:dict[str, str]
+
+
 def targtype(typestr: TypeString) -> tuple[str, int, int]:
     """Determine the storage type from the given type string - used in
     initializers. Returns the modifier character, the size of its storage,
     and the real size of the type.
     """
     assert len(typestr) >= 1
-    size = tysize(typestr)
-    match typestr[0].type:
-        case 'float':
-            return 'f', size, size
-        case 'double':
-            return 'd', size, size
-        case 'char':
-            return 'c', size, size
-        case 'struct':
-            return 'w', tysize([Int6]), tysize(typestr)
-        case 'point' | 'int' | 'struct' | 'func':
-            return 'w', tysize([Int6]), size
-        case 'array':
-            assert len(typestr) > 1
-            return targtype(typestr[1:])
-    raise ValueError
-
-
-def initconv(node: Node) -> tuple[Node, int]:
+    i = 0
+    while typestr[i].type == 'array':
+        i += 1
+        assert len(typestr) > i
+    size = tysize(typestr[i:])
+    cmd = storecmds.get(typestr[i].type)
+    if cmd is None:
+        raise ValueError
+    if cmd == 'w':
+        return cmd, Int6.tysize(), size
+    return cmd, size, size
+
+
+def initconv(node: Node) -> tuple[Node, int] | None:
     """Convert the expression node into the proper setup for initexpr's
-    return. Seperate because it's recursive.
+    return, or None if it's not a valid initializer.
     """
+    # Peel off any constant offsets added to or subtracted from an address
+    offset = 0
+    offsetted = False
+    while node.label in ('add', 'sub'):
+        if node[0].label == 'con':
+            assert isinstance(node[0], Leaf)
+            curoffset = node[0].value
+            check = node[1]
+        elif node[1].label == 'con':
+            assert isinstance(node[1], Leaf)
+            curoffset = node[1].value
+            check = node[0]
+        else:
+            return None
+        if node.label == 'sub':
+            curoffset = -curoffset
+        offset += curoffset
+        offsetted = True
+        node = check
     match node.label:
         case 'fcon' | 'con':
-            return node, 0
+            if not offsetted:
+                return node, 0
         case 'addr':
             child = node[0]
             if child.label in ('string', 'name'):
-                return child, 0
-        case 'add' | 'sub':
-            if node[0].label == 'con':
-                assert isinstance(node[0], Leaf)
-                curoffset = node[0].value
-                check = node[1]
-            elif node[1].label == 'con':
-                assert isinstance(node[1], Leaf)
-                curoffset = node[1].value
-                check = node[0]
-            else:
-                raise ValueError
-            if node.label == 'sub':
-                curoffset = -curoffset
-            # pylint:disable=unpacking-non-sequence
-            node, offset = initconv(check)
-            if node.label not in ('name', 'string'):
-                raise ValueError
-            return node, offset + curoffset
-    raise ValueError
+                return child, offset
+    return None
 
 
 def initexpr(parser: Parser) -> tuple[Node, int]:
@@ -389,13 +444,11 @@ def initexpr(parser: Parser) -> tuple[Node, int]:
     integer offset.
     """
     node = expression(parser, seecommas=False)
-    try:
-        # pylint:disable=unpacking-non-sequence
-        node, offset = initconv(node)
-    except ValueError:
+    init = initconv(node)
+    if init is None:
         parser.error('bad initializer')
-        return Leaf('con', parser.curline, [Int6], [], 1), 0
-    return node, offset
+        return conleaf(parser.curline, 1), 0
+    return init
 
 
 def outinit(parser: Parser, cmd: str, node: Node, offset: int,
@@ -408,13 +461,10 @@ def outinit(parser: Parser, cmd: str, node: Node, offset: int,
             pseudo(parser, f'{cmd} {node.value}')
         case 'name' | 'string':
             assert isinstance(node, Leaf)
-            if offset:
-                offstr = f"{'-' if offset < 0 else '+'}{abs(offset)}"
-            else:
-                offstr = ''
+            offstr = f'{offset:+}' if offset else ''
             if node.label == 'string':
                 assert isinstance(node.value, bytes)
-                strbytes = ','.join((str(b) for b in node.value))
+                strbytes = dcbytes(node.value)
                 if asmstring:
                     goseg(parser, 'string')
                     label = parser.nextstatic()
@@ -449,15 +499,16 @@ def datainit(parser: Parser, typestr: TypeString) -> TypeString:
     elembytes = 0
 
     if parser.match('{'):
-        def parselist(parser: Parser, token: Token) -> bool:
-            nonlocal elembytes
-
-            parser.unsee(token)
+        match = parser.match
+        peek_label = parser.peek_label
+        while not match('}'):
+            parser.eoferror()
             node, offset = initexpr(parser)
             outinit(parser, cmd, node, offset)
             elembytes += storesize
-            return True
-        parser.list('}', parselist)
+            if peek_label() != '}' and not parser.need(','):
+                parser.termskip()
+                break
     else:
         node, offset = initexpr(parser)
         if node.label == 'string' and typestr[0].type == 'array' and \
@@ -472,18 +523,17 @@ def datainit(parser: Parser, typestr: TypeString) -> TypeString:
         outinit(parser, cmd, node, offset, asmstr)
         elembytes += incbytes
 
-    numelems = ceil(elembytes / realsize)
+    numelems = -(-elembytes // realsize)
     elemsize = realsize * numelems
     if elemsize > totalsize:
-        typestr = typestr.copy()
         assert len(typestr) >= 1
         if typestr[0].type == 'array':
             # Adjust array size
             assert len(typestr) >= 2
-            typestr[0] = TypeElem('array', numelems)
+            typestr = (typeelem('array', numelems),) + typestr[1:]
             totalsize = elemsize
     if totalsize > elembytes:
-        asm(parser, f'.ds {totalsize - elembytes}')
+        asmop(parser, '.ds', totalsize - elembytes)
 
     return typestr
 
@@ -492,42 +542,43 @@ def datadef(parser: Parser, name: str, typestr: TypeString) -> None:
     """Handles an external data definition, possibly followed by an
     initializer.
     """
-    if parser.peek().label in (',', ';'):
-        # No initializer
-        goseg(parser, 'bss')
+    asmname = '_' + name
+    if parser.peek_label() in (',', ';'):
+        # No initializer; a function declaration reserves no storage
         if typestr[0].type != 'func':
-            pseudo(parser, f'common _{name}, {tysize(typestr)}')
+            goseg(parser, 'bss')
+            pseudo(parser, f'common {asmname}, {tysize(typestr)}')
     else:
         # Initializer
         goseg(parser, 'data')
-        deflab(parser, f'_{name}')
+        deflab(parser, asmname)
         typestr = datainit(parser, typestr)
     symbol = Symbol(
         name,
         'extern',
-        typestr.copy()
+        typestr
     )
     parser.symtab[name] = symbol
-    pseudo(parser, f'export _{name}')
+    pseudo(parser, f'export {asmname}')
 
 
-def extdef(parser: Parser) -> bool:
-    """Process a line of external definitions."""
-    def extcallback(parser: Parser, name: str, storage: StorageClass,
-                    typestr: TypeString, params: list[str],
-                    count: int) -> bool:
-        """Constructs an external definition having seen its specifier."""
-        if typestr[0] == Func6:
-            if parser.peek().label in (',', ';'):
-                pass  # uninitialized function
+def extcallback(parser: Parser, name: str, storage: StorageClass,
+                typestr: TypeString, params: list[str], count: int) -> bool:
+    """Constructs an external definition having seen its specifier."""
+    if typestr[0] == Func6:
+        if parser.peek_label() in (',', ';'):
+            pass  # uninitialized function
+        else:
+            if count > 1:
+                parser.errskip('function definition not first element in '
+                               'specifier list')
             else:
-                if count > 1:
-                    parser.errskip('function definition not first element in '
-                                   'specifier list')
-                else:
-                    funcdef(parser, name, typestr, params)
-                return False
-        datadef(parser, name, typestr)
-        return True
+                funcdef(parser, name, typestr, params)
+            return False
+    datadef(parser, name, typestr)
+    return True
+
 
+def extdef(parser: Parser) -> bool:
+    """Process a line of external definitions."""
     return specline(parser, False, extcallback)
@@ -1,181 +1,205 @@
 """C6T - C version 6 by Troy - Statement Handling"""
 
-from assembly import asm, asmexpr, deflab, fasm, goseg, pseudo
-from expr import Node, conexpr, expression
+from assembly import asm, asmexpr, asmop, deflab, fasm, goseg
+from expr import Node, conexpr, expression, sideeffects
 from parse_state import Parser
 from symtab import Symbol
-from type6 import Int6, TypeElem
+from type6 import LabelType6
+import util
 
 
 def statement(parser: Parser, retflt: bool):
     """Process a single statement recursively.
     """
-    goseg(parser, 'text')
-    token = next(parser)
-    match token.label:
-        case 'name':
-            if parser.match(':'):
-                addgoto(parser, token.value)
-                statement(parser, retflt)
-            else:
+    # A labelled statement's label is handled, then the loop goes on to the
+    # statement it labels instead of recursing.
+    while True:
+        goseg(parser, 'text')
+        token = next(parser)
+        match token.label:
+            case 'name':
+                if parser.match(':'):
+                    addgoto(parser, token.value)
+                    continue
                 parser.unsee(token)
                 doexpr(parser)
-        case 'if':
-            labfalse = parser.nextstatic()
-            parenexpr(parser, labfalse)
-            statement(parser, retflt)
-            if parser.match('else'):
-                labtrue = parser.nextstatic()
-                asm(parser, f'jmp {labtrue}')
-                deflab(parser, labfalse)
-                statement(parser, retflt)
-                deflab(parser, labtrue)
-            else:  # Ironic, isn't it?
-                deflab(parser, labfalse)
-        case 'while':
-            parser.contstk.append(parser.nextstatic())
-            parser.brkstk.append(parser.nextstatic())
-            deflab(parser, parser.contstk[-1])
-            parenexpr(parser, parser.brkstk[-1])
-            statement(parser, retflt)
-            asm(parser, f'jmp {parser.contstk[-1]}')
-            deflab(parser, parser.brkstk[-1])
-            parser.contstk.pop()
-            parser.brkstk.pop()
-        case 'do':
-            lab = parser.nextstatic()
-            parser.contstk.append(parser.nextstatic())
-            parser.brkstk.append(parser.nextstatic())
-
-            deflab(parser, lab)
-            statement(parser, retflt)
-            parser.need('while')
-            deflab(parser, parser.contstk[-1])
-            parenexpr(parser, parser.brkstk[-1])
-            parser.need(';')
-            asm(parser, f'jmp {lab}')
-            deflab(parser, parser.brkstk[-1])
-
-            parser.brkstk.pop()
-            parser.contstk.pop()
-        case 'for':
-            lab1 = parser.nextstatic()
-            parser.brkstk.append(parser.nextstatic())
-            parser.contstk.append(parser.nextstatic())
-
-            parser.need('(')
-            if not parser.match(';'):
-                asmexpr(parser, expression(parser), 'eval')
-                parser.need(';')
-            deflab(parser, lab1)
-            if not parser.match(';'):
-                asmexpr(parser, expression(parser))
-                asm(parser, f'brz {parser.brkstk[-1]}')
-                parser.need(';')
-            if parser.match(')'):
-                update = None
-                parser.contstk[-1] = lab1
-            else:
-                update = expression(parser)
+            case 'if':
+                parser.need('(')
+                node = expression(parser)
                 parser.need(')')
-
-            statement(parser, retflt)
-            if update:
-                deflab(parser, parser.contstk[-1])
-                asmexpr(parser, update, 'eval')
-            asm(parser, f'jmp {lab1}')
-            deflab(parser, parser.brkstk[-1])
-
-            parser.contstk.pop()
-            parser.brkstk.pop()
-        case 'switch':
-            parser.brkstk.append(parser.nextstatic())
-
-            parser.casestk.append({})
-            parser.defaultstk.append(None)
-
-            swdest = parser.nextstatic()
-
-            parser.need('(')
-            node = expression(parser)
-            parser.need(')')
-
-            asm(parser, f'jmp {swdest}')
-
-            statement(parser, retflt)
-
-            deflab(parser, swdest)
-            doswitch(parser, node, parser.casestk.pop(),
-                     parser.defaultstk.pop())
-
-            deflab(parser, parser.brkstk[-1])
-            parser.brkstk.pop()
-        case 'case':
-            con = conexpr(parser)
-            parser.need(':')
-            if len(parser.casestk) < 1:
-                parser.error('case outside of switch')
-            else:
-                label = parser.nextstatic()
-                if con in parser.casestk[-1]:
-                    parser.error(f'redefined case {con}')
-                parser.casestk[-1][con] = label
-                deflab(parser, label)
-            statement(parser, retflt)
-        case 'default':
-            parser.need(':')
-            if len(parser.defaultstk) < 1:
-                parser.error('default outside of switch')
-            elif parser.defaultstk[-1]:
-                parser.error('multiple defaults')
-            else:
+                empty = parser.match(';')
+                if empty and parser.peek_label() != 'else':
+                    # Nothing to branch around, so only the condition's
+                    # side effects are kept
+                    if sideeffects(node):
+                        asmexpr(parser, node, 'eval')
+                    return
+                if empty:
+                    parser.unsee(empty)
+                asmexpr(parser, node)
+                labfalse = parser.nextstatic()
+                asmop(parser, 'brz', labfalse)
+                statement(parser, retflt)
+                if parser.match('else'):
+                    labtrue = parser.nextstatic()
+                    asmop(parser, 'jmp', labtrue)
+                    deflab(parser, labfalse)
+                    statement(parser, retflt)
+                    deflab(parser, labtrue)
+                else:  # Ironic, isn't it?
+                    deflab(parser, labfalse)
+            case 'while':
+                cont = parser.nextstatic()
+                brk = parser.nextstatic()
+                parser.contstk.append(cont)
+                parser.brkstk.append(brk)
+                deflab(parser, cont)
+                parenexpr(parser, brk)
+                statement(parser, retflt)
+                asmop(parser, 'jmp', cont)
+                deflab(parser, brk)
+                parser.contstk.pop()
+                parser.brkstk.pop()
+            case 'do':
                 lab = parser.nextstatic()
-                parser.defaultstk[-1] = lab
+                cont = parser.nextstatic()
+                brk = parser.nextstatic()
+                parser.contstk.append(cont)
+                parser.brkstk.append(brk)
+
                 deflab(parser, lab)
-            statement(parser, retflt)
-        case 'break':
-            parser.need(';')
-            try:
-                lab = parser.brkstk[-1]
-            except IndexError:
-                parser.error('nothing to break to')
-                return
-            asm(parser, f'jmp {lab}')
-        case 'continue':
-            parser.need(';')
-            try:
-                lab = parser.contstk[-1]
-            except IndexError:
-                parser.error("nothing to continue to")
-                return
-            asm(parser, f'jmp {lab}')
-        case 'return':
-            if parser.match(';'):
-                asm(parser, 'retnull')
-            else:
+                statement(parser, retflt)
+                parser.need('while')
+                deflab(parser, cont)
+                parenexpr(parser, brk)
+                parser.need(';')
+                asmop(parser, 'jmp', lab)
+                deflab(parser, brk)
+
+                parser.brkstk.pop()
+                parser.contstk.pop()
+            case 'for':
+                lab1 = parser.nextstatic()
+                brk = parser.nextstatic()
+                cont = parser.nextstatic()
+                parser.brkstk.append(brk)
+                parser.contstk.append(cont)
+
+                parser.need('(')
+                if not parser.match(';'):
+                    asmexpr(parser, expression(parser), 'eval')
+                    parser.need(';')
+                deflab(parser, lab1)
+                if not parser.match(';'):
+                    asmexpr(parser, expression(parser))
+                    asmop(parser, 'brz', brk)
+                    parser.need(';')
+                if parser.match(')'):
+                    update = None
+                    parser.contstk[-1] = lab1
+                else:
+                    update = expression(parser)
+                    parser.need(')')
+
+                statement(parser, retflt)
+                if update:
+                    deflab(parser, cont)
+                    asmexpr(parser, update, 'eval')
+                asmop(parser, 'jmp', lab1)
+                deflab(parser, brk)
+
+                parser.contstk.pop()
+                parser.brkstk.pop()
+            case 'switch':
+                brk = parser.nextstatic()
+                parser.brkstk.append(brk)
+
+                parser.casestk.append({})
+                parser.defaultstk.append(None)
+
+                swdest = parser.nextstatic()
+
                 parser.need('(')
                 node = expression(parser)
                 parser.need(')')
-                parser.need(';')
-                asmexpr(parser, node)
-                if retflt and not node.typestr[0].floating:
-                    asm(parser, 'toflt')
-                if (not retflt) and node.typestr[0].floating:
-                    asm(parser, 'toint')
-                fasm(parser, 'ret', retflt)
-        case 'goto':
-            asmexpr(parser, expression(parser))
-            parser.need(';')
-            asm(parser, 'ijmp')
-        case ';':
-            return
-        case '{':
-            while not parser.match('}'):
-                parser.eoferror()
+
+                asmop(parser, 'jmp', swdest)
+
                 statement(parser, retflt)
-        case _:
-            parser.unsee(token)
-            doexpr(parser)
+
+                deflab(parser, swdest)
+                doswitch(parser, node, parser.casestk.pop(),
+                         parser.defaultstk.pop())
+
+                deflab(parser, brk)
+                parser.brkstk.pop()
+            case 'case':
+                con = conexpr(parser)
+                parser.need(':')
+                if len(parser.casestk) < 1:
+                    parser.error('case outside of switch')
+                else:
+                    label = parser.nextstatic()
+                    if con in parser.casestk[-1]:
+                        parser.error(f'redefined case {con}')
+                    parser.casestk[-1][con] = label
+                    deflab(parser, label)
+                continue
+            case 'default':
+                parser.need(':')
+                if len(parser.defaultstk) < 1:
+                    parser.error('default outside of switch')
+                elif parser.defaultstk[-1]:
+                    parser.error('multiple defaults')
+                else:
+                    lab = parser.nextstatic()
+                    parser.defaultstk[-1] = lab
+                    deflab(parser, lab)
+                continue
+            case 'break':
+                parser.need(';')
+                try:
+                    lab = parser.brkstk[-1]
+                except IndexError:
+                    parser.error('nothing to break to')
+                    return
+                asmop(parser, 'jmp', lab)
+            case 'continue':
+                parser.need(';')
+                try:
+                    lab = parser.contstk[-1]
+                except IndexError:
+                    parser.error("nothing to continue to")
+                    return
+                asmop(parser, 'jmp', lab)
+            case 'return':
+                if parser.match(';'):
+                    asm(parser, 'retnull')
+                else:
+                    parser.need('(')
+                    node = expression(parser)
+                    parser.need(')')
+                    parser.need(';')
+                    asmexpr(parser, node)
+                    if retflt != node.typestr[0].floating:
+                        asm(parser, 'toflt' if retflt else 'toint')
+                    fasm(parser, 'ret', retflt)
+            case 'goto':
+                asmexpr(parser, expression(parser))
+                parser.need(';')
+                asm(parser, 'ijmp')
+            case ';':
+                return
+            case '{':
+                match = parser.match
+                eoferror = parser.eoferror
+                while not match('}'):
+                    eoferror()
+                    statement(parser, retflt)
+            case _:
+                parser.unsee(token)
+                doexpr(parser)
+        return
 
 
 def parenexpr(parser: Parser, label: str) -> None:
@@ -186,7 +210,7 @@ def parenexpr(parser: Parser, label: str) -> None:
     node = expression(parser)
     parser.need(')')
     asmexpr(parser, node)
-    asm(parser, f'brz {label}')
+    asmop(parser, 'brz', label)
 
 
 def doexpr(parser: Parser):
@@ -199,18 +223,17 @@ def doexpr(parser: Parser):
 def addgoto(parser: Parser, name: str):
     """Define a new goto label.
     """
-    if name not in parser.symtab:
-        parser.symtab[name] = Symbol(
+    symbol = parser.symtab.get(name)
+    if symbol is None:
+        symbol = parser.symtab[name] = Symbol(
             name,
             'static',
-            [TypeElem('array', 1), Int6],
+            LabelType6,
             parser.nextstatic(),
             local=True
         )
-    symbol = parser.symtab[name]
-    if symbol.storage != 'static' or symbol.typestr != [TypeElem('array', 1),
-                                                        Int6] or not \
-            symbol.local:
+    if symbol.storage != 'static' or symbol.typestr != LabelType6 or \
+            not symbol.local:
         parser.error(f'bad goto label {name}')
     else:
         if symbol.undefined:
@@ -221,22 +244,51 @@ def addgoto(parser: Parser, name: str):
 
 def doswitch(parser: Parser, node: Node, cases: dict[int, str],
              default: None | str):
-    """Output assembly for a switch statement.
+    """Output assembly for a switch statement. Cases filling at least half
+    their range of values get a table indexed by value, others a table of
+    value and label pairs that is searched.
     """
+    if default is None:
+        try:
+            default = parser.brkstk[-1]
+        except IndexError:
+            parser.error('missing break for switch')
+    if node.label == 'con' and default is not None:
+        # A constant selector always goes to the same place, so no table is
+        # needed
+        asmop(parser, 'jmp', cases.get(node.value, default))
+        return
+    dense = False
+    if cases and default is not None:
+        # Case values are words; range them as signed so small negative
+        # cases sit next to the positive ones
+        values = [con - 0x10000 if con & 0x8000 else con for con in cases]
+        low = min(values)
+        span = max(values) - low + 1
+        dense = span <= 2 * len(values)
     goseg(parser, 'data')
     tablab = parser.nextstatic()
     deflab(parser, tablab)
-    for con, label in cases.items():
-        pseudo(parser, f'dw {con}, {label}')
+    if dense:
+        # One target per value from the lowest case up, holes going to the
+        # default
+        asm(parser, ''.join(
+            f'\t.dw {cases.get(util.word(value), default)}\n'
+            for value in range(low, low + span)))
+    elif cases:
+        # The whole table goes out as one block of already formatted lines
+        asm(parser, ''.join(f'\t.dw {con}, {label}\n'
+                            for con, label in cases.items()))
     goseg(parser, 'text')
     asmexpr(parser, node)
-    if default:
-        asm(parser, f'extern {default}')
+    if default is not None:
+        asmop(parser, 'extern', default)
+    if dense:
+        asmop(parser, 'con', span)
+        asmop(parser, 'con', util.word(low))
+        asmop(parser, 'extern', tablab)
+        asm(parser, 'dswitch')
     else:
-        try:
-            asm(parser, f'extern {parser.brkstk[-1]}')
-        except IndexError:
-            parser.error('missing break for switch')
-    asm(parser, f'con {len(cases)}')
-    asm(parser, f'extern {tablab}')
-    asm(parser, 'doswitch')
+        asmop(parser, 'con', len(cases))
+        asmop(parser, 'extern', tablab)
+        asm(parser, 'doswitch')
@@ -9,7 +9,7 @@ StorageClass = Literal['extern', 'static',
                        'auto', 'register', 'struct', 'member']
 
 
-@dataclass
+@dataclass(slots=True)
 class Symbol:
     """A symbol table entry."""
     name: str
@@ -1,7 +1,6 @@
 """C6T - C version 6 by Troy - Type System"""
 
-from dataclasses import dataclass
-from functools import cached_property
+from dataclasses import dataclass, field
 from typing import Literal
 
 
@@ -9,13 +8,35 @@ BaseType = Literal['int', 'char', 'float', 'double', 'struct']
 ModType = Literal['point', 'func', 'array']
 
 
-@dataclass(frozen=True)
+# The fixed sizes of the unsized type elements, in bytes
+elemsizes = {
+    'int': 2, 'point': 2, 'func': 0, 'char': 1, 'float': 4, 'double': 8
+}  # type:dict[str, int]
+
+
+@dataclass(frozen=True, slots=True)
 class TypeElem:
     """A single C6T type element."""
     type: BaseType | ModType
     size: int = 0
+    # Flags for the kind of element, set once from the type
+    pointer: bool = field(init=False, repr=False, compare=False)
+    integral: bool = field(init=False, repr=False, compare=False)
+    floating: bool = field(init=False, repr=False, compare=False)
+    sized: bool = field(init=False, repr=False, compare=False)
+    _tysize: int = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self) -> None:
+        type_ = self.type
+        object.__setattr__(self, '_tysize', elemsizes.get(type_, self.size))
+        object.__setattr__(self, 'pointer', type_ in ('point', 'array'))
+        object.__setattr__(self, 'integral', type_ in ('int', 'char'))
+        object.__setattr__(self, 'floating', type_ in ('float', 'double'))
+        object.__setattr__(self, 'sized', type_ in ('struct', 'array'))
 
     def __eq__(self, __o: object) -> bool:
+        if __o is self:
+            return True
         if isinstance(__o, TypeElem):
             if __o.type != self.type:
                 return False
@@ -28,40 +49,7 @@ class TypeElem:
         """Return the size of the element, in bytes, or element count for an
         array.
         """
-        match self.type:
-            case 'int' | 'point':
-                return 2
-            case 'func':
-                return 0
-            case 'char':
-                return 1
-            case 'float':
-                return 4
-            case 'double':
-                return 8
-            case _:
-                assert self.sized
-                return self.size
-
-    @cached_property
-    def pointer(self) -> bool:
-        """Returns a flag for if this is a pointer type."""
-        return self.type in ('point', 'array')
-
-    @cached_property
-    def integral(self) -> bool:
-        """Returns a flag for if this is an integral type."""
-        return self.type in ('int', 'char')
-
-    @cached_property
-    def floating(self) -> bool:
-        """Returns a flag for if this is a floating type."""
-        return self.type in ('float', 'double')
-
-    @cached_property
-    def sized(self) -> bool:
-        """Returns a flag for if this type has a custom size."""
-        return self.type in ('struct', 'array')
+        return self._tysize
 
 
 Int6 = TypeElem('int')
@@ -72,12 +60,45 @@ Double6 = TypeElem('double')
 Point6 = TypeElem('point')
 Func6 = TypeElem('func')
 
-TypeString = list[TypeElem]
+# The shared unsized base type elements, keyed by their type keyword
+basetypes = {
+    'int': Int6, 'char': Char6, 'float': Float6, 'double': Double6
+}  # type:dict[str, TypeElem]
+
+# Every element made so far, keyed by exact type and size. The key is a
+# plain tuple, since TypeElem equality deliberately ignores unset sizes.
+_elems = {
+    (elem.type, elem.size): elem
+    for elem in (Int6, Char6, Float6, Double6, Point6, Func6)
+}  # type:dict[tuple[str, int], TypeElem]
+
+
+def typeelem(type_: BaseType | ModType, size: int = 0) -> TypeElem:
+    """Return the shared type element of the given type and size."""
+    key = (type_, size)
+    elem = _elems.get(key)
+    if elem is None:
+        elem = _elems[key] = TypeElem(type_, size)
+    return elem
+
+
+TypeString = tuple[TypeElem, ...]
+
+# Shared type strings for the plain int and double types; type strings are
+# never mutated, so these are used rather than building new ones.
+IntType6 = (Int6,)  # type:TypeString
+DoubleType6 = (Double6,)  # type:TypeString
+# The type of a goto label, also given to names used before being defined
+LabelType6 = (typeelem('array', 1), Int6)  # type:TypeString
+
 
 def tysize(typestr: TypeString) -> int:
     """Returns the size of the type string in bytes."""
     assert len(typestr) > 0
-    if typestr[0].type == 'array':
-        assert len(typestr) > 1
-        return tysize(typestr[1:]) * typestr[0].tysize()
-    return typestr[0].tysize()
+    # Multiply through the leading array counts without slicing the string
+    count = 1
+    for elem in typestr:
+        if elem.type != 'array':
+            return count * elem.tysize()
+        count *= elem.tysize()
+    raise AssertionError('array type string without an element type')
@@ -1,12 +1,15 @@
 """C6T - C version 6 by Troy - Utility Routines"""
 
+# Masks an integer into an unsigned 16bit int. Python's & already works on
+# the two's complement of a negative, so this also wraps them around.
+WORDMASK = 0xFFFF
+
+
 def word(i: int) -> int:
     """Perform overflow and unsigning operations to get the integer into the
     same shape as an unsigned 16bit int.
     """
-    if i < 0:
-        i = ((-i) ^ 0xFFFF) + 1
-    return i & 0xFFFF
+    return i & WORDMASK
 
 
 class CompilerCrash(BaseException):